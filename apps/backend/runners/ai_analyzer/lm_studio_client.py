@@ -2,20 +2,263 @@
 LM Studio / OpenAI-compatible client wrapper for AI analysis.
 """
 
+import asyncio
 import json
+import logging
 import os
-import glob
-import subprocess
 import re
+import shutil
+import signal
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, List, Dict, Optional
+from typing import Any
 
 try:
-    from openai import AsyncOpenAI
+    from openai import (
+        AsyncOpenAI,
+        BadRequestError,
+        NotFoundError,
+        Timeout,
+        UnprocessableEntityError,
+    )
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
+# orjson is optional; it raises a json.JSONDecodeError subclass, so callers
+# can handle both parsers the same way
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+
+# Tool schema sent with every completion request. Built once at import time
+# since it never changes between queries.
+_TOOL_DEFS: tuple[dict[str, Any], ...] = (
+    {
+        "type": "function",
+        "function": {
+            "name": "Read",
+            "description": "Read the contents of a file. Large files are truncated; use offset and limit to page through them.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "relative_path": {
+                        "type": "string",
+                        "description": "The relative path to the file to read."
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "The line number to start reading from (1-based, default 1)."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "The maximum number of lines to read."
+                    }
+                },
+                "required": ["relative_path"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "Glob",
+            "description": "Find files matching a glob pattern.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "The glob pattern to search for (e.g., '**/*.py')."
+                    }
+                },
+                "required": ["pattern"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "Grep",
+            "description": "Search for a text pattern in files.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "The regex or text pattern to search for."
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": "The path or glob pattern to search in (default '.')."
+                    }
+                },
+                "required": ["pattern"]
+            }
+        }
+    }
+)
+
+# The same tools in the flat shape the Responses API expects
+_RESPONSES_TOOL_DEFS: tuple[dict[str, Any], ...] = tuple(
+    {"type": "function", **tool["function"]} for tool in _TOOL_DEFS
+)
+
+# Instructions for models without native function calling (see _parse_text_tool_call)
+_TEXT_TOOL_PROTOCOL = (
+    "Tools are available through a text protocol. To call one, reply with only a JSON object "
+    'of the form {"tool": "<name>", "arguments": {...}} and nothing else. Available tools:\n'
+    + "\n".join(
+        f"- {tool['function']['name']}: {tool['function']['description']} "
+        f"Arguments: {', '.join(tool['function']['parameters']['properties'])}"
+        for tool in _TOOL_DEFS
+    )
+    + "\nThe tool result will be sent back to you. When you are done, reply with your final "
+    'analysis JSON, which must not contain a "tool" key.'
+)
+
+_TOOL_NAMES = frozenset(tool["function"]["name"] for tool in _TOOL_DEFS)
+
+# Max characters a single Read returns to the model
+_READ_MAX_CHARS = 64 * 1024
+
+# Files larger than this are read fresh each time instead of pinned in the Read cache
+_READ_CACHE_MAX_BYTES = 1024 * 1024
+
+# Max bytes per grep output line (asyncio's default of 64KB chokes on minified files)
+_GREP_LINE_LIMIT = 1024 * 1024
+
+# One AsyncOpenAI client per (base_url, api_key) and event loop, shared by every
+# LMStudioAnalysisClient so keep-alive connections survive across analyzers.
+# The connection pool is bound to the loop that created it, so a later
+# asyncio.run() gets fresh clients. The pools reference their loop, so closed
+# loops are pruned explicitly rather than relying on weak references.
+_CLIENT_CACHE: dict[asyncio.AbstractEventLoop, dict[tuple[str, str], "AsyncOpenAI"]] = {}
+
+
+def _get_shared_client(base_url: str, api_key: str) -> "AsyncOpenAI":
+    """Return the shared client for the running event loop (call from a coroutine)."""
+    loop = asyncio.get_running_loop()
+    clients = _CLIENT_CACHE.get(loop)
+    if clients is None:
+        for closed_loop in [other for other in _CLIENT_CACHE if other.is_closed()]:
+            del _CLIENT_CACHE[closed_loop]
+        clients = _CLIENT_CACHE[loop] = {}
+
+    key = (base_url, api_key)
+    client = clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            # Local models can take minutes to answer, but a dead server should fail fast
+            timeout=Timeout(600.0, connect=5.0),
+            max_retries=2,
+        )
+        clients[key] = client
+    return client
+
+# Native tool-calling support per (base_url, model), filled by the first query
+_TOOL_SUPPORT: dict[tuple[str, str], bool] = {}
+
+# time.monotonic() before which an inconclusive tool probe is not repeated
+_TOOL_PROBE_RETRY_AT: dict[tuple[str, str], float] = {}
+
+# Per-loop locks so concurrent queries share one tool probe per (base_url, model)
+_TOOL_PROBE_LOCKS: dict[asyncio.AbstractEventLoop, dict[tuple[str, str], asyncio.Lock]] = {}
+
+
+def _get_tool_probe_lock(key: tuple[str, str]) -> asyncio.Lock:
+    """Return the tool probe lock for key on the running event loop."""
+    loop = asyncio.get_running_loop()
+    locks = _TOOL_PROBE_LOCKS.get(loop)
+    if locks is None:
+        for closed_loop in [other for other in _TOOL_PROBE_LOCKS if other.is_closed()]:
+            del _TOOL_PROBE_LOCKS[closed_loop]
+        locks = _TOOL_PROBE_LOCKS[loop] = {}
+    return locks.setdefault(key, asyncio.Lock())
+
+# Base URLs whose server does not implement the Responses API
+_RESPONSES_API_UNSUPPORTED: set[str] = set()
+
+# (base_url, model) pairs whose Responses API rejected the seed
+_RESPONSES_SEED_UNSUPPORTED: set[tuple[str, str]] = set()
+
+# (base_url, model) pairs whose server rejected response_format=json_object
+_JSON_MODE_UNSUPPORTED: set[tuple[str, str]] = set()
+
+
+@lru_cache(maxsize=128)
+def _read_cached(path_str: str, mtime_ns: int, size: int) -> str:
+    """
+    Read a file's text, memoized on (path, mtime, size).
+
+    A modified file produces a new cache key, so stale entries are never
+    returned; they just age out of the LRU.
+    """
+    return Path(path_str).read_text(encoding='utf-8')
+
+
+@lru_cache(maxsize=64)
+def _compile_grep_pattern(pattern: str) -> "re.Pattern[bytes]":
+    """Compile a Grep pattern for matching raw file bytes, cached across calls."""
+    return re.compile(pattern.encode("utf-8"))
+
+
+def _parse_text_tool_call(content: str) -> tuple[str, str] | None:
+    """Return (tool name, arguments JSON) if a reply is a text-protocol tool call."""
+    text = content.strip()
+    if text.startswith("```"):
+        # Tolerate replies wrapped in a Markdown code fence
+        text = text.strip("`").strip()
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        data = _json_loads(text)
+    except ValueError:
+        return None
+
+    if not isinstance(data, dict) or data.get("tool") not in _TOOL_NAMES:
+        return None
+    return data["tool"], json.dumps(data.get("arguments") or {})
+
+
+def _split_lines(text: str) -> list[str]:
+    """
+    Split text after each "\n", keeping the line endings.
+
+    Unlike str.splitlines this ignores \f, \v, \x1c-\x1e, \x85 and
+    \u2028, so line numbers agree with counting "\n".
+    """
+    lines = [line + "\n" for line in text.split("\n")]
+    last = lines.pop()[:-1]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def _parse_line_arg(value: Any, name: str) -> int | None:
+    """
+    Validate a Read offset/limit argument (a 1-based line number or count).
+
+    Integer strings are accepted since some models quote numbers in tool
+    arguments. Raises ValueError with a message meant for the model.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    if value < 1:
+        raise ValueError(f"{name} must be at least 1, got {value}")
+    return value
+
 
 class LMStudioAnalysisClient:
     """
@@ -27,6 +270,16 @@ class LMStudioAnalysisClient:
     DEFAULT_BASE_URL = "http://localhost:1234/v1"
     DEFAULT_API_KEY = "lm-studio"
     DEFAULT_MODEL = "model-identifier"  # LM Studio often ignores this provided the model is loaded
+    MAX_TURNS = 10
+    MAX_IDENTICAL_TOOL_CALLS = 2  # A model repeating the exact same call more often is looping
+    MAX_TOKENS = 8192  # Upper bound per completion so the server can stop early
+    SEED = 94032  # Fixed seed + temperature 0 for reproducible analyses
+    TOOL_PROBE_TIMEOUT = 10  # Seconds to wait for the tool-calling capability probe
+    TOOL_PROBE_MAX_TOKENS = 256  # Room for a short tool call (or a brief reasoning preamble)
+    TOOL_PROBE_RETRY_SECONDS = 300  # Skip re-probing this long after an inconclusive probe
+    GREP_TIMEOUT = 10  # Seconds a single Grep may run, on every backend
+    KEEP_TOOL_TURNS = 4  # Tool outputs of the most recent turns are kept verbatim in the chat history
+    ELIDE_MIN_CHARS = 2048  # Older tool outputs at least this long are replaced by a stub
 
     def __init__(self, project_dir: Path):
         """
@@ -41,6 +294,10 @@ class LMStudioAnalysisClient:
             )
 
         self.project_dir = project_dir
+        # Resolve once; Path.resolve() hits the filesystem for every path component.
+        # The trailing separator keeps "/foo" from matching "/foobar" in the sandbox check.
+        self._project_root = project_dir.resolve(strict=False)
+        self._project_root_str = os.path.join(str(self._project_root), "")
         # Support both LM_STUDIO_ specific env vars and generic ANTHROPIC_ ones set by the frontend profile system
         self.base_url = os.getenv("LM_STUDIO_BASE_URL", os.getenv("ANTHROPIC_BASE_URL", self.DEFAULT_BASE_URL))
         if self.base_url.endswith("/v1/"):
@@ -53,8 +310,26 @@ class LMStudioAnalysisClient:
         self.api_key = os.getenv("LM_STUDIO_API_KEY", os.getenv("ANTHROPIC_AUTH_TOKEN", self.DEFAULT_API_KEY))
         self.model = os.getenv("LM_STUDIO_MODEL", os.getenv("ANTHROPIC_MODEL", self.DEFAULT_MODEL))
 
-        print(f"DEBUG: LM Studio Client initialized with base_url: {self.base_url}")
-        self.client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+        logger.debug("LM Studio client initialized with base_url=%s", self.base_url)
+        # Resolved lazily per event loop, see the client property
+        self._client: AsyncOpenAI | None = None
+
+        self._system_prompt = self._get_system_prompt()
+
+        # Prefer ripgrep for Grep, then grep; None means use the in-process scanner
+        self._grep_bin = shutil.which("rg") or shutil.which("grep")
+        self._grep_is_rg = self._grep_bin is not None and Path(self._grep_bin).stem == "rg"
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """The OpenAI client for the running event loop (only valid inside a coroutine)."""
+        if self._client is not None:
+            return self._client
+        return _get_shared_client(self.base_url, self.api_key)
+
+    @client.setter
+    def client(self, value: "AsyncOpenAI") -> None:
+        self._client = value
 
     async def run_analysis_query(self, prompt: str) -> str:
         """
@@ -64,34 +339,43 @@ class LMStudioAnalysisClient:
         
         For broad compatibility with LM Studio models (which might handle function calling differently),
         we will define tools in the API call.
+
+        Servers that implement the Responses API keep the conversation
+        server-side, so only new tool outputs are sent each turn. Otherwise
+        we fall back to resending the chat history via Chat Completions.
+        Models without native function calling get a text-based tool protocol.
         """
-        
-        tools = self._get_tool_definitions()
+        if not await self._supports_tools():
+            return await self._run_text_query(prompt)
+
+        if self.base_url not in _RESPONSES_API_UNSUPPORTED and hasattr(self.client, "responses"):
+            result = await self._run_responses_query(prompt)
+            if result is not None:
+                return result
+
+        return await self._run_chat_query(prompt)
+
+    async def _run_chat_query(self, prompt: str) -> str:
+        tools = _TOOL_DEFS
         
         messages = [
-            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "system", "content": self._system_prompt},
             {"role": "user", "content": prompt}
         ]
 
         # Basic Loop for Tool Use
         # We limit turns to avoid infinite loops
-        max_turns = 10
-        current_turn = 0
+        call_counts: dict[tuple[str, str], int] = {}
+        # Index of each turn's first tool message, for eliding by turn
+        tool_turn_starts: list[int] = []
 
-        while current_turn < max_turns:
-            current_turn += 1
-            
+        for current_turn in range(self.MAX_TURNS):
             try:
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    tools=tools,
-                    tool_choice="auto"
-                )
+                response = await self._create_completion(messages, tools)
             except Exception as e:
                 return f"Error communicating with LM Studio: {str(e)}"
             
-            print(f"DEBUG: Full LM Studio Response: {response}")
+            logger.debug("LM Studio response: %s", response)
 
             if not response or not response.choices:
                 return "Error: Received empty response from LM Studio (no choices returned)."
@@ -103,122 +387,403 @@ class LMStudioAnalysisClient:
                 # No more tools, this is the final response
                 return message.content or ""
 
-            # Processor Tool Calls
-            for tool_call in message.tool_calls:
-                function_name = tool_call.function.name
-                arguments_str = tool_call.function.arguments
-                
-                try:
-                    arguments = json.loads(arguments_str)
-                except json.JSONDecodeError:
-                    # Fallback or error
-                    tool_output = f"Error: Invalid JSON arguments for {function_name}"
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": function_name,
-                        "content": tool_output
-                    })
-                    continue
+            # Tool results from the last turn would never reach the model, so skip running them
+            if current_turn == self.MAX_TURNS - 1:
+                break
 
-                # Execute
-                result = await self._execute_tool(function_name, arguments)
-                
+            tool_calls = message.tool_calls
+            calls = [(tc.function.name, tc.function.arguments) for tc in tool_calls]
+            if self._is_looping(call_counts, calls):
+                return message.content or "Analysis terminated: Repeated tool call loop detected."
+
+            results = await self._run_tool_calls(calls)
+
+            tool_turn_starts.append(len(messages))
+            for tool_call, result in zip(tool_calls, results):
                 messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call.id,
-                    "name": function_name,
-                    "content": str(result)
+                    "name": tool_call.function.name,
+                    "content": result
                 })
 
-        return messages[-1].content or "Analysis terminated: Max turns reached."
+            self._elide_old_tool_outputs(messages, tool_turn_starts)
+
+        return message.content or "Analysis terminated: Max turns reached."
+
+    async def _run_responses_query(self, prompt: str) -> str | None:
+        """
+        Tool-use loop over the Responses API, chaining turns with previous_response_id.
+
+        The first request doubles as the capability probe. If the endpoint
+        does not exist (404, or a 200 error payload) the base URL is
+        remembered as unsupported; any other rejection of the first request
+        (e.g. a prompt that overflows the context) only falls back for this
+        query. In both cases None is returned so the caller can use Chat
+        Completions instead.
+        """
+        call_counts: dict[tuple[str, str], int] = {}
+        input_items: list[dict[str, Any]] = [{"role": "user", "content": prompt}]
+        previous_response_id = None
+        text = ""
+
+        for current_turn in range(self.MAX_TURNS):
+            kwargs: dict[str, Any] = {
+                "model": self.model,
+                "instructions": self._system_prompt,
+                "input": input_items,
+                "tools": _RESPONSES_TOOL_DEFS,
+                "temperature": 0,
+                "max_output_tokens": self.MAX_TOKENS,
+            }
+            if previous_response_id:
+                kwargs["previous_response_id"] = previous_response_id
+
+            try:
+                response = await self._create_response(kwargs)
+            except Exception as e:
+                if current_turn == 0 and isinstance(e, NotFoundError):
+                    _RESPONSES_API_UNSUPPORTED.add(self.base_url)
+                    return None
+                if current_turn == 0 and isinstance(e, (BadRequestError, UnprocessableEntityError)):
+                    return None
+                return f"Error communicating with LM Studio: {str(e)}"
+
+            logger.debug("LM Studio response: %s", response)
+
+            output = getattr(response, "output", None)
+            if not isinstance(output, list) or not getattr(response, "id", None):
+                # Some servers answer unknown endpoints with a 200 error payload
+                if current_turn == 0:
+                    _RESPONSES_API_UNSUPPORTED.add(self.base_url)
+                    return None
+                return "Error: Received empty response from LM Studio (no output returned)."
+
+            text = response.output_text or text
+            function_calls = [item for item in output if item.type == "function_call"]
+            if not function_calls:
+                # No more tools, this is the final response
+                return text
+
+            # Tool results from the last turn would never reach the model, so skip running them
+            if current_turn == self.MAX_TURNS - 1:
+                break
+
+            calls = [(fc.name, fc.arguments) for fc in function_calls]
+            if self._is_looping(call_counts, calls):
+                return text or "Analysis terminated: Repeated tool call loop detected."
+
+            results = await self._run_tool_calls(calls)
+
+            # The server already holds the history; send only the new tool outputs
+            previous_response_id = response.id
+            input_items = [
+                {"type": "function_call_output", "call_id": fc.call_id, "output": result}
+                for fc, result in zip(function_calls, results)
+            ]
+
+        return text or "Analysis terminated: Max turns reached."
+
+    async def _create_response(self, kwargs: dict[str, Any]) -> Any:
+        """
+        Create a Responses API turn with the same seed as _create_completion.
+
+        Every turn offers tools, so JSON mode is not requested (see
+        _create_completion). The seed is not a Responses API parameter, so
+        it goes in the request body; it is dropped and remembered as
+        unsupported for this server/model only if the same request succeeds
+        without it.
+        """
+        key = (self.base_url, self.model)
+        if key not in _RESPONSES_SEED_UNSUPPORTED:
+            try:
+                return await self.client.responses.create(**kwargs, extra_body={"seed": self.SEED})
+            except (BadRequestError, UnprocessableEntityError):
+                # Only blame the seed if the same request succeeds without it
+                response = await self.client.responses.create(**kwargs)
+                _RESPONSES_SEED_UNSUPPORTED.add(key)
+                return response
+
+        return await self.client.responses.create(**kwargs)
+
+    async def _supports_tools(self) -> bool:
+        """
+        Check once per server/model whether the model emits native tool calls.
+
+        Only a clean "stop" without tool calls counts as unsupported. Errors,
+        timeouts (e.g. the model is still loading) and truncated answers are
+        inconclusive: assume tools work for TOOL_PROBE_RETRY_SECONDS, then
+        probe again. Concurrent queries wait for a single probe.
+        """
+        key = (self.base_url, self.model)
+        if key in _TOOL_SUPPORT:
+            return _TOOL_SUPPORT[key]
+        if time.monotonic() < _TOOL_PROBE_RETRY_AT.get(key, 0.0):
+            return True
+
+        async with _get_tool_probe_lock(key):
+            # Another query may have probed while we waited for the lock
+            if key in _TOOL_SUPPORT:
+                return _TOOL_SUPPORT[key]
+            if time.monotonic() < _TOOL_PROBE_RETRY_AT.get(key, 0.0):
+                return True
+
+            supported = await self._probe_tool_support()
+            if supported is None:
+                _TOOL_PROBE_RETRY_AT[key] = time.monotonic() + self.TOOL_PROBE_RETRY_SECONDS
+                return True
+
+            if not supported:
+                logger.info(
+                    "Model '%s' does not support tool calling, using text tool protocol.", self.model
+                )
+            _TOOL_SUPPORT[key] = supported
+            _TOOL_PROBE_RETRY_AT.pop(key, None)
+            return supported
+
+    async def _probe_tool_support(self) -> bool | None:
+        """Ask the model to call a tool; None if the answer is inconclusive."""
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": "Use the Glob tool to list files matching '*'."}],
+                    tools=_TOOL_DEFS,
+                    tool_choice="auto",
+                    temperature=0,
+                    max_tokens=self.TOOL_PROBE_MAX_TOKENS,
+                ),
+                timeout=self.TOOL_PROBE_TIMEOUT,
+            )
+        except Exception as e:
+            logger.debug("Tool support probe failed: %s", e)
+            return None
+
+        if not response or not response.choices:
+            return None
+
+        choice = response.choices[0]
+        if choice.message.tool_calls:
+            return True
+        if choice.finish_reason == "stop":
+            return False
+        return None
+
+    async def _run_text_query(self, prompt: str) -> str:
+        """
+        Tool-use loop for models without native function calling.
+
+        The model requests a tool by replying with a JSON object of the form
+        {"tool": ..., "arguments": {...}}; the result is sent back as a user
+        message. Any other reply is the final answer.
+        """
+        messages: list[dict[str, Any]] = [
+            {"role": "system", "content": self._system_prompt + "\n\n" + _TEXT_TOOL_PROTOCOL},
+            {"role": "user", "content": prompt}
+        ]
+        call_counts: dict[tuple[str, str], int] = {}
+        content = ""
+
+        for current_turn in range(self.MAX_TURNS):
+            try:
+                response = await self._create_completion(messages)
+            except Exception as e:
+                return f"Error communicating with LM Studio: {str(e)}"
+
+            logger.debug("LM Studio response: %s", response)
+
+            if not response or not response.choices:
+                return "Error: Received empty response from LM Studio (no choices returned)."
+
+            content = response.choices[0].message.content or ""
+            call = _parse_text_tool_call(content)
+            if call is None:
+                # No tool requested, this is the final response
+                return content
+
+            # Tool results from the last turn would never reach the model, so skip running them
+            if current_turn == self.MAX_TURNS - 1:
+                break
+
+            if self._is_looping(call_counts, [call]):
+                return "Analysis terminated: Repeated tool call loop detected."
+
+            name = call[0]
+            (result,) = await self._run_tool_calls([call])
+            messages.append({"role": "assistant", "content": content})
+            messages.append({"role": "user", "content": f"Result of {name}:\n{result}"})
+
+        return "Analysis terminated: Max turns reached."
+
+    def _is_looping(self, call_counts: dict[tuple[str, str], int], calls: list[tuple[str, str]]) -> bool:
+        """Count (name, arguments) pairs; True once any exceeds MAX_IDENTICAL_TOOL_CALLS."""
+        for key in calls:
+            call_counts[key] = call_counts.get(key, 0) + 1
+            if call_counts[key] > self.MAX_IDENTICAL_TOOL_CALLS:
+                return True
+        return False
+
+    async def _run_tool_calls(self, calls: list[tuple[str, str]]) -> list[str]:
+        # Run tool calls concurrently; results come back in the original order
+        # so the assistant's call id references stay valid.
+        results = await asyncio.gather(
+            *(self._run_tool_call(name, arguments_str) for name, arguments_str in calls),
+            return_exceptions=True,
+        )
+
+        return [
+            f"Error executing {name}: {str(result)}" if isinstance(result, Exception) else str(result)
+            for (name, _), result in zip(calls, results)
+        ]
+
+    async def _create_completion(self, messages: list[Any], tools: Any = None) -> Any:
+        """
+        Request a chat completion with deterministic decoding.
+
+        JSON mode is only requested without ``tools``, where the reply is
+        either the final answer or a text-protocol tool call, both JSON.
+        Servers that enforce json_object by constraining decoding would
+        otherwise never let the model emit a native tool call, and would not
+        raise an error for it either.
+
+        Not every LM Studio backend accepts ``response_format``; if the server
+        rejects it, retry without and skip JSON mode for this server/model
+        from then on.
+        """
+        kwargs: dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0,
+            "seed": self.SEED,
+            "max_tokens": self.MAX_TOKENS,
+        }
+        if tools is not None:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = "auto"
+
+        key = (self.base_url, self.model)
+        if tools is None and key not in _JSON_MODE_UNSUPPORTED:
+            try:
+                return await self.client.chat.completions.create(
+                    **kwargs, response_format={"type": "json_object"}
+                )
+            except BadRequestError:
+                # Only blame JSON mode if the same request succeeds without it
+                response = await self.client.chat.completions.create(**kwargs)
+                _JSON_MODE_UNSUPPORTED.add(key)
+                return response
+
+        return await self.client.chat.completions.create(**kwargs)
+
+    async def run_analyses(self, prompts: list[str], concurrency: int = 8) -> list[str]:
+        """
+        Run several independent analysis queries concurrently.
+
+        LM Studio batches concurrent requests on the server side, so a bounded
+        number of in-flight queries raises throughput without flooding it.
+
+        Args:
+            prompts: Analysis prompts to run
+            concurrency: Maximum number of queries in flight at once
+
+        Returns:
+            Responses in the same order as ``prompts``
+
+        Raises:
+            ValueError: If ``concurrency`` is less than 1
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one(prompt: str) -> str:
+            async with sem:
+                return await self.run_analysis_query(prompt)
+
+        return await asyncio.gather(*(_one(p) for p in prompts))
+
+    def _elide_old_tool_outputs(self, messages: list[Any], turn_starts: list[int]) -> None:
+        """
+        Replace large tool outputs from older turns in-place with a short stub.
+
+        Every completion resends the whole history, so a big Read from an
+        early turn would otherwise be re-sent and re-processed on every
+        later turn. All outputs of the last KEEP_TOOL_TURNS turns are kept
+        verbatim, however many tools a turn called in parallel.
+
+        Args:
+            messages: The chat history, ending with the latest turn's tool messages
+            turn_starts: Index in messages of each turn's first tool message
+        """
+        if len(turn_starts) <= self.KEEP_TOOL_TURNS:
+            return
+
+        # Earlier turns were elided by previous calls; only the turn that
+        # just left the window still needs it
+        start = turn_starts[-self.KEEP_TOOL_TURNS - 1]
+        end = turn_starts[-self.KEEP_TOOL_TURNS]
+        for tool_message in messages[start:end]:
+            if not isinstance(tool_message, dict) or tool_message.get("role") != "tool":
+                continue
+            content = tool_message["content"]
+            if len(content) >= self.ELIDE_MIN_CHARS:
+                name = tool_message["name"]
+                tool_message["content"] = (
+                    f"<{name} output elided ({len(content)} characters); "
+                    f"call {name} again if you still need it>"
+                )
+
+    async def _run_tool_call(self, function_name: str, arguments_str: str) -> str:
+        try:
+            arguments = _json_loads(arguments_str)
+        except json.JSONDecodeError:
+            return f"Error: Invalid JSON arguments for {function_name}"
+
+        return await self._execute_tool(function_name, arguments)
 
     def _get_system_prompt(self) -> str:
         return (
             f"You are a senior software architect analyzing this codebase. "
-            f"Your working directory is: {self.project_dir.resolve()}\n"
+            f"Your working directory is: {self._project_root}\n"
             f"You have access to tools to read files, search files, and find files.\n"
             f"Use these tools to analyze the code based on the user's request. "
             f"Output your final analysis as valid JSON only."
         )
 
-    def _get_tool_definitions(self) -> List[Dict[str, Any]]:
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "Read",
-                    "description": "Read the contents of a file.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "relative_path": {
-                                "type": "string",
-                                "description": "The relative path to the file to read."
-                            }
-                        },
-                        "required": ["relative_path"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "Glob",
-                    "description": "Find files matching a glob pattern.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "pattern": {
-                                "type": "string",
-                                "description": "The glob pattern to search for (e.g., '**/*.py')."
-                            }
-                        },
-                        "required": ["pattern"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "Grep",
-                    "description": "Search for a text pattern in files.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "pattern": {
-                                "type": "string",
-                                "description": "The regex or text pattern to search for."
-                            },
-                            "path": {
-                                "type": "string",
-                                "description": "The path or glob pattern to search in (default '.')."
-                            }
-                        },
-                        "required": ["pattern"]
-                    }
-                }
-            }
-        ]
+    def _get_tool_definitions(self) -> tuple[dict[str, Any], ...]:
+        return _TOOL_DEFS
 
-    async def _execute_tool(self, name: str, args: Dict[str, Any]) -> str:
+    async def _execute_tool(self, name: str, args: dict[str, Any]) -> str:
+        # Read and Glob do blocking filesystem work, so run them in a worker
+        # thread to keep the event loop free for concurrent tool calls.
         if name == "Read":
-            return self._tool_read(args.get("relative_path"))
+            return await asyncio.to_thread(
+                self._tool_read, args.get("relative_path"), args.get("offset"), args.get("limit")
+            )
         elif name == "Glob":
-            return self._tool_glob(args.get("pattern"))
+            return await asyncio.to_thread(self._tool_glob, args.get("pattern"))
         elif name == "Grep":
-            return self._tool_grep(args.get("pattern"), args.get("path", "."))
+            return await self._tool_grep(args.get("pattern"), args.get("path", "."))
         else:
             return f"Error: Unknown tool {name}"
 
-    def _tool_read(self, relative_path: str) -> str:
+    def _tool_read(
+        self, relative_path: str, offset: int | None = None, limit: int | None = None
+    ) -> str:
         if not relative_path:
             return "Error: path is required"
+
+        try:
+            offset = _parse_line_arg(offset, "offset")
+            limit = _parse_line_arg(limit, "limit")
+        except ValueError as e:
+            return f"Error: {e}"
         
         try:
-            target_path = (self.project_dir / relative_path).resolve()
+            target_path = (self._project_root / relative_path).resolve()
             # Security check: ensure path is within project dir
-            if not str(target_path).startswith(str(self.project_dir.resolve())):
+            if target_path != self._project_root and not str(target_path).startswith(self._project_root_str):
                  return "Error: Access denied (path outside project directory)"
             
             if not target_path.exists():
@@ -228,9 +793,37 @@ class LMStudioAnalysisClient:
                 return f"Error: Not a file: {relative_path}"
 
             try:
-                return target_path.read_text(encoding='utf-8')
+                st = target_path.stat()
+                if st.st_size > _READ_CACHE_MAX_BYTES:
+                    content = target_path.read_text(encoding='utf-8')
+                else:
+                    content = _read_cached(str(target_path), st.st_mtime_ns, st.st_size)
             except UnicodeDecodeError:
                 return "Error: File is binary or not UTF-8 encoded"
+
+            start = 0
+            if offset is not None or limit is not None:
+                start = (offset or 1) - 1
+                lines = _split_lines(content)
+                if start > 0 and start >= len(lines):
+                    return f"Error: offset {offset} is past the end of the file ({len(lines)} lines)"
+                end = start + limit if limit is not None else len(lines)
+                content = "".join(lines[start:end])
+
+            # Every turn resends prior tool output, so cap what a single Read returns.
+            # Cut on a line boundary so the model can resume with offset.
+            if len(content) > _READ_MAX_CHARS:
+                cut = content.rfind("\n", 0, _READ_MAX_CHARS) + 1
+                if not cut:
+                    # A single overlong line; there is no line to resume from
+                    return content[:_READ_MAX_CHARS] + f"\n... ({len(content) - _READ_MAX_CHARS} more characters truncated)"
+                next_line = start + content.count("\n", 0, cut) + 1
+                return (
+                    content[:cut]
+                    + f"... ({len(content) - cut} more characters truncated, use offset={next_line} to continue)"
+                )
+
+            return content
                 
         except Exception as e:
             return f"Error reading file: {str(e)}"
@@ -242,65 +835,177 @@ class LMStudioAnalysisClient:
         try:
             # recursively search if ** is in pattern, otherwise just search
             # We need to be careful with globbing in the correct directory
-            # glob.glob in python doesn't strictly adhere to .gitignore, 
+            # glob.glob in python doesn't strictly adhere to .gitignore,
             # but for this simple client it should suffice.
             
-            # Change to project dir to run glob relative to it
-            matched_files = []
-            
-            # Use rglob if pattern starts with **/ or contains /**/ 
+            # Literal patterns (no glob metacharacters) name a single path,
+            # so skip the directory walk and just check that file.
+            if not any(c in pattern for c in "*?["):
+                candidate = self._project_root / pattern
+                if not candidate.is_file():
+                    return "No files found matching the pattern."
+                return str(candidate.relative_to(self._project_root))
+
+            # Use rglob if pattern starts with **/ or contains /**/
             # actually pathlib.Path.glob is better/safer
             
-            results = list(self.project_dir.glob(pattern))
-            
-            # Convert to relative paths strings
-            matched_files = [str(p.relative_to(self.project_dir)) for p in results if p.is_file()]
+            # Convert to relative paths strings. Consume the glob lazily and only
+            # count (not store) files past the limit to keep memory bounded.
+            matched_files = []
+            extra = 0
+            for p in self._project_root.glob(pattern):
+                if not p.is_file():
+                    continue
+                if len(matched_files) < 100:
+                    matched_files.append(str(p.relative_to(self._project_root)))
+                else:
+                    extra += 1
             
             if not matched_files:
                 return "No files found matching the pattern."
             
             # Limit results to avoided Context Window explosion
-            if len(matched_files) > 100:
-                return "\n".join(matched_files[:100]) + f"\n... ({len(matched_files) - 100} more files truncated)"
+            if extra:
+                return "\n".join(matched_files) + f"\n... ({extra} more files truncated)"
             
             return "\n".join(matched_files)
 
         except Exception as e:
             return f"Error executing glob: {str(e)}"
 
-    def _tool_grep(self, pattern: str, path: str = ".") -> str:
+    async def _tool_grep(self, pattern: str, path: str = ".") -> str:
         if not pattern:
             return "Error: pattern is required"
         
-        # We'll use grep subprocess for speed and reliability, assuming Linux environment
-        # as indicated in user_information.
-        
         try:
-            # Construct grep command
-            # -r: recursive
-            # -n: line numbers
-            # -I: ignore binary files
-            cmd = ["grep", "-rnI", pattern, path]
-            
-            result = subprocess.run(
-                cmd,
-                cwd=str(self.project_dir),
-                capture_output=True,
-                text=True,
-                timeout=10 # Avoid hanging forever
-            )
-            
-            output = result.stdout
-            if not output:
-                return "No matches found."
-                
-            lines = output.splitlines()
-            if len(lines) > 100:
-                return "\n".join(lines[:100]) + f"\n... ({len(lines) - 100} more matches truncated)"
-                
-            return output
-            
-        except subprocess.TimeoutExpired:
+            if self._grep_bin is None:
+                lines, truncated = await asyncio.to_thread(self._scan_files, pattern, path)
+            else:
+                lines, truncated = await self._run_grep(pattern, path)
+        except TimeoutError:
             return "Error: Grep timed out"
         except Exception as e:
             return f"Error executing grep: {str(e)}"
+
+        if not lines:
+            return "No matches found."
+            
+        if truncated:
+            return "\n".join(lines) + "\n... (more matches truncated)"
+            
+        return "\n".join(lines)
+
+    async def _run_grep(self, pattern: str, path: str) -> tuple[list[str], bool]:
+        if self._grep_is_rg:
+            # -uu: include hidden and ignored files (binary files are still skipped)
+            cmd = [self._grep_bin, "-n", "-uu", "--no-heading", "--with-filename", pattern, path]
+        else:
+            # -r: recursive
+            # -n: line numbers
+            # -I: ignore binary files
+            # -E: extended regex, closest to the rg and Python syntax ("foo|bar")
+            cmd = [self._grep_bin, "-rnIE", pattern, path]
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(self._project_root),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=_GREP_LINE_LIMIT,
+        )
+
+        # Assume grep must be stopped unless it runs to EOF on its own; killing a
+        # grep that already exited makes the asyncio child watcher log noise.
+        truncated = True
+        reader = asyncio.ensure_future(self._read_grep_lines(proc.stdout))
+        try:
+            # asyncio.wait instead of wait_for: before Python 3.11 wait_for raises
+            # asyncio.TimeoutError, which is not the builtin TimeoutError
+            done, _ = await asyncio.wait({reader}, timeout=self.GREP_TIMEOUT)
+            if not done:
+                raise TimeoutError("grep timed out")
+            lines, truncated = reader.result()
+            return lines, truncated
+        finally:
+            reader.cancel()
+            # Stop grep as soon as we have enough matches (or gave up waiting)
+            if truncated and proc.returncode is None:
+                try:
+                    if os.name == "posix":
+                        # os.kill never reaps the child, unlike Popen.send_signal,
+                        # so the watcher still collects it; an unreaped pid can't be reused
+                        os.kill(proc.pid, signal.SIGKILL)
+                    else:
+                        proc.kill()
+                except ProcessLookupError:
+                    pass
+            await proc.wait()
+
+    @staticmethod
+    async def _read_grep_lines(stream: asyncio.StreamReader) -> tuple[list[str], bool]:
+        """Read up to 100 grep output lines; report whether more were available."""
+        lines = []
+        async for raw in stream:
+            if len(lines) == 100:
+                return lines, True
+            lines.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+        return lines, False
+
+    def _scan_files(self, pattern: str, path: str) -> tuple[list[str], bool]:
+        """
+        Pure-Python Grep fallback for systems without rg or grep.
+
+        Output mirrors ``grep -rnI``: ``path:line:text``, binary files skipped.
+        Runs in a worker thread, which can't be cancelled, so it enforces
+        GREP_TIMEOUT itself and raises TimeoutError.
+        """
+        regex = _compile_grep_pattern(pattern)
+        lines: list[str] = []
+        deadline = time.monotonic() + self.GREP_TIMEOUT
+
+        def check_deadline() -> None:
+            if time.monotonic() > deadline:
+                raise TimeoutError("grep timed out")
+
+        def scan_file(file_path: str, display: str) -> bool:
+            check_deadline()
+            try:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return False
+            if b"\0" in data[:8192]:
+                return False
+
+            for lineno, line in enumerate(data.splitlines(), 1):
+                if regex.search(line):
+                    if len(lines) == 100:
+                        return True
+                    text = line.decode("utf-8", errors="replace")
+                    lines.append(f"{display}:{lineno}:{text}")
+            return False
+
+        root = os.path.join(str(self._project_root), path)
+        if os.path.isfile(root):
+            return lines, scan_file(root, path)
+
+        stack = [(root, path)]
+        while stack:
+            dir_path, display_dir = stack.pop()
+            check_deadline()
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+
+            subdirs = []
+            for entry in entries:
+                display = os.path.join(display_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, display))
+                elif entry.is_file() and scan_file(entry.path, display):
+                    return lines, True
+            stack.extend(reversed(subdirs))
+
+        return lines, False
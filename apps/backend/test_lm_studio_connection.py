@@ -1,5 +1,6 @@
 
 import asyncio
+import logging
 import os
 import sys
 from pathlib import Path
@@ -51,6 +52,10 @@ async def test_connection():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # -v dumps the client's debug logging (full LM Studio responses)
+    if "-v" in sys.argv[1:]:
+        logging.basicConfig(level=logging.DEBUG)
+
     # Force generic provider env vars just in case, though client defaults should work
     if not os.getenv("LM_STUDIO_BASE_URL"):
         os.environ["LM_STUDIO_BASE_URL"] = "http://localhost:1234/v1"
@@ -2,21 +2,28 @@ import os
 import json
 import subprocess
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 DOCUFLOW_DIR = "/home/hendrik/DocuFlow"
 SPECS_DIR = os.path.join(DOCUFLOW_DIR, ".auto-claude/specs")
 
-def check_merged(branch_name):
+def list_branches(*args):
+    """Return the short names of auto-claude branches matching the given for-each-ref filters."""
     try:
-        # Check if branch exists
-        subprocess.run(["git", "-C", DOCUFLOW_DIR, "rev-parse", "--verify", branch_name], 
-                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        # Check if merged
-        result = subprocess.run(["git", "-C", DOCUFLOW_DIR, "merge-base", "--is-ancestor", branch_name, "main"],
-                                check=False)
-        return result.returncode == 0
+        output = subprocess.check_output(
+            ["git", "-C", DOCUFLOW_DIR, "for-each-ref", "--format=%(refname:lstrip=2)", *args, "refs/heads/auto-claude/"],
+            stderr=subprocess.DEVNULL, text=True)
     except subprocess.CalledProcessError:
+        return set()
+    return set(output.splitlines())
+
+def check_merged(branch_name, existing, merged):
+    if branch_name not in existing:
         return None # Branch does not exist
+    return branch_name in merged
 
 def main():
     if not os.path.exists(SPECS_DIR):
@@ -26,31 +33,38 @@ def main():
     print(f"{'Task ID':<50} | {'Status':<15} | {'Branch':<40} | {'Merged?'}")
     print("-" * 120)
 
-    for item in sorted(os.listdir(SPECS_DIR)):
-        spec_path = os.path.join(SPECS_DIR, item)
-        if not os.path.isdir(spec_path):
-            continue
+    done_tasks = []
+    # DirEntry.is_dir() reuses the type info from the directory read (no extra stat)
+    with os.scandir(SPECS_DIR) as it:
+        spec_entries = sorted((entry for entry in it if entry.is_dir()), key=lambda entry: entry.name)
 
-        plan_path = os.path.join(spec_path, "implementation_plan.json")
-        if not os.path.exists(plan_path):
-            continue
+    for entry in spec_entries:
+        item = entry.name
+        plan_path = os.path.join(entry.path, "implementation_plan.json")
 
         try:
-            with open(plan_path, 'r') as f:
-                plan = json.load(f)
+            with open(plan_path, 'rb') as f:
+                plan = json_loads(f.read())
             
             status = plan.get('status', 'unknown')
             if status in ['done', 'completed']:
-                branch_name = f"auto-claude/{item}"
-                is_merged = check_merged(branch_name)
-                
-                merged_str = "YES" if is_merged else "NO"
-                if is_merged is None:
-                    merged_str = "Branch Missing"
-                
-                print(f"{item:<50} | {status:<15} | {branch_name:<40} | {merged_str}")
+                done_tasks.append((item, status, f"auto-claude/{item}"))
+        except FileNotFoundError:
+            continue # No implementation plan yet
         except Exception as e:
             print(f"Error checking {item}: {e}")
 
+    # Two git calls up front instead of two per branch
+    existing = list_branches()
+    merged = list_branches("--merged", "main")
+
+    for item, status, branch_name in done_tasks:
+        is_merged = check_merged(branch_name, existing, merged)
+        merged_str = "YES" if is_merged else "NO"
+        if is_merged is None:
+            merged_str = "Branch Missing"
+        
+        print(f"{item:<50} | {status:<15} | {branch_name:<40} | {merged_str}")
+
 if __name__ == "__main__":
     main()
@@ -1,8 +1,17 @@
 import requests
+from requests.adapters import HTTPAdapter
 
-try:
-    response = requests.get("http://localhost:4000/v1/models")
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {response.text}")
-except Exception as e:
-    print(f"Error: {e}")
+# Reuse one keep-alive connection across probes instead of reconnecting each time
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+def list_models(base_url="http://localhost:4000/v1"):
+    return _SESSION.get(f"{base_url}/models")
+
+if __name__ == "__main__":
+    try:
+        response = list_models()
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,820 @@
+#!/usr/bin/env python3
+"""
+Tests for the LM Studio analysis client
+=======================================
+
+Covers the tool loop, fallbacks and tool implementations of
+runners/ai_analyzer/lm_studio_client.py using fake OpenAI clients, so no
+LM Studio server is needed.
+"""
+
+import asyncio
+import copy
+import importlib.util
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+# Load the module directly; importing the runners package pulls in the CLI
+backend_path = Path(__file__).parent.parent / "apps" / "backend"
+_spec = importlib.util.spec_from_file_location(
+    "lm_studio_client",
+    backend_path / "runners" / "ai_analyzer" / "lm_studio_client.py"
+)
+lm_studio_client = importlib.util.module_from_spec(_spec)
+sys.modules["lm_studio_client"] = lm_studio_client
+_spec.loader.exec_module(lm_studio_client)
+LMStudioAnalysisClient = lm_studio_client.LMStudioAnalysisClient
+
+
+# =============================================================================
+# FAKES
+# =============================================================================
+
+def make_chat_response(content=None, tool_calls=None, finish_reason="stop"):
+    """Build an object shaped like a ChatCompletion."""
+    message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)])
+
+
+def make_tool_call(call_id, name, arguments):
+    """Build an object shaped like a chat tool call."""
+    return SimpleNamespace(
+        id=call_id,
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def make_api_error(error_class, status_code):
+    """Build an openai APIStatusError subclass without a real HTTP response."""
+    response = SimpleNamespace(status_code=status_code, headers={}, request=None)
+    return error_class(f"HTTP {status_code}", response=response, body=None)
+
+
+def make_response(response_id, output, output_text=""):
+    """Build an object shaped like a Responses API Response."""
+    return SimpleNamespace(id=response_id, output=output, output_text=output_text)
+
+
+def make_function_call(call_id, name, arguments):
+    """Build an object shaped like a Responses API function_call item."""
+    return SimpleNamespace(
+        type="function_call", call_id=call_id, name=name, arguments=json.dumps(arguments)
+    )
+
+
+class FakeEndpoint:
+    """Records create() kwargs as sent and replays scripted responses or exceptions."""
+
+    def __init__(self, script=None, delay=0):
+        self.script = list(script or [])
+        self.delay = delay
+        self.calls = []
+
+    async def create(self, **kwargs):
+        # Copy, since the client keeps editing the message list it passed in
+        self.calls.append(copy.deepcopy(kwargs))
+        await asyncio.sleep(self.delay)
+        result = self.script.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def project(tmp_path):
+    """A small project directory for the tools to work on."""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("hello world\n")
+    (tmp_path / "src" / "b.py").write_text("def foo(): pass\n")
+    return tmp_path
+
+
+@pytest.fixture
+def client(project, monkeypatch):
+    """LM Studio client wired to a fake chat endpoint, tool support assumed."""
+    monkeypatch.setenv("LM_STUDIO_BASE_URL", "http://lm-studio.test/v1")
+    monkeypatch.setenv("LM_STUDIO_MODEL", "test-model")
+    # Capability caches are process-wide; start and end each test clean
+    caches = (
+        lm_studio_client._TOOL_SUPPORT,
+        lm_studio_client._TOOL_PROBE_RETRY_AT,
+        lm_studio_client._RESPONSES_API_UNSUPPORTED,
+        lm_studio_client._JSON_MODE_UNSUPPORTED,
+        lm_studio_client._RESPONSES_SEED_UNSUPPORTED,
+    )
+    for cache in caches:
+        cache.clear()
+
+    instance = LMStudioAnalysisClient(project)
+    instance.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeEndpoint()))
+    lm_studio_client._TOOL_SUPPORT[(instance.base_url, instance.model)] = True
+    yield instance
+
+    for cache in caches:
+        cache.clear()
+
+
+@pytest.fixture
+def text_client(client):
+    """The same client for a model without native tool calling."""
+    lm_studio_client._TOOL_SUPPORT[(client.base_url, client.model)] = False
+    return client
+
+
+# =============================================================================
+# Shared OpenAI client
+# =============================================================================
+
+class _ModelsHandler(BaseHTTPRequestHandler):
+    """Answers GET /v1/models over keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"object": "list", "data": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def models_server():
+    """A local OpenAI-compatible server that only lists models."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ModelsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+class TestSharedClient:
+    """Tests for the per-event-loop AsyncOpenAI client cache."""
+
+    def test_separate_asyncio_runs_get_working_clients(self, project, monkeypatch, models_server):
+        monkeypatch.setenv("LM_STUDIO_BASE_URL", models_server)
+        monkeypatch.setattr(lm_studio_client, "_CLIENT_CACHE", {})
+        instance = LMStudioAnalysisClient(project)
+
+        async def list_models():
+            client = instance.client
+            assert instance.client is client
+            await client.models.list()
+            return client
+
+        # The keep-alive connection from the first run must not leak into the second
+        first = asyncio.run(list_models())
+        second = asyncio.run(list_models())
+
+        assert first is not second
+        assert len(lm_studio_client._CLIENT_CACHE) == 1
+
+
+# =============================================================================
+# run_analyses
+# =============================================================================
+
+class TestRunAnalyses:
+    """Tests for concurrent analysis queries."""
+
+    async def test_preserves_order_and_limits_concurrency(self, client):
+        in_flight = 0
+        peak = 0
+
+        async def fake_query(prompt):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            # Finish out of order: earlier prompts take longer
+            await asyncio.sleep(0.01 * (10 - int(prompt)))
+            in_flight -= 1
+            return f"result-{prompt}"
+
+        client.run_analysis_query = fake_query
+        prompts = [str(i) for i in range(10)]
+
+        results = await client.run_analyses(prompts, concurrency=3)
+
+        assert results == [f"result-{i}" for i in range(10)]
+        assert peak == 3
+
+    @pytest.mark.parametrize("concurrency", [0, -1])
+    async def test_rejects_concurrency_below_one(self, client, concurrency):
+        with pytest.raises(ValueError):
+            await client.run_analyses(["prompt"], concurrency=concurrency)
+
+
+# =============================================================================
+# Read tool
+# =============================================================================
+
+class TestToolRead:
+    """Tests for Read paging, validation and truncation."""
+
+    @pytest.fixture
+    def ten_lines(self, project):
+        (project / "ten.txt").write_text("".join(f"line {i}\n" for i in range(1, 11)))
+        return "ten.txt"
+
+    def test_reads_whole_file(self, client):
+        assert client._tool_read("src/a.py") == "hello world\n"
+
+    def test_offset_and_limit_page_through_lines(self, client, ten_lines):
+        assert client._tool_read(ten_lines, offset=3, limit=2) == "line 3\nline 4\n"
+        assert client._tool_read(ten_lines, offset=9) == "line 9\nline 10\n"
+        assert client._tool_read(ten_lines, limit=1) == "line 1\n"
+
+    def test_accepts_integer_strings(self, client, ten_lines):
+        assert client._tool_read(ten_lines, offset="2", limit="1") == "line 2\n"
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"limit": 0},
+            {"limit": -1},
+            {"offset": 0},
+            {"offset": "x"},
+            {"limit": 1.5},
+            {"limit": True},
+        ],
+    )
+    def test_rejects_invalid_offset_or_limit(self, client, ten_lines, kwargs):
+        result = client._tool_read(ten_lines, **kwargs)
+        assert result.startswith("Error: ")
+        assert "must be" in result
+
+    def test_offset_past_end_of_file(self, client, ten_lines):
+        result = client._tool_read(ten_lines, offset=11)
+        assert result == "Error: offset 11 is past the end of the file (10 lines)"
+
+    @pytest.mark.parametrize(
+        "relative_path",
+        ["../foo-other/secret.txt", "../secret.txt", "src/../../secret.txt", "link/secret.txt"],
+    )
+    def test_denies_paths_outside_project(self, tmp_path, relative_path):
+        # A sibling sharing the project's name as a prefix used to pass the check
+        root = tmp_path / "foo"
+        (root / "src").mkdir(parents=True)
+        (tmp_path / "foo-other").mkdir()
+        (tmp_path / "foo-other" / "secret.txt").write_text("sibling secret\n")
+        (tmp_path / "secret.txt").write_text("parent secret\n")
+        (root / "link").symlink_to(tmp_path / "foo-other")
+
+        result = LMStudioAnalysisClient(root)._tool_read(relative_path)
+
+        assert result == "Error: Access denied (path outside project directory)"
+
+    def test_symlinked_project_root_is_shared_by_all_tools(self, tmp_path):
+        real = tmp_path / "real"
+        (real / "src").mkdir(parents=True)
+        (real / "src" / "a.py").write_text("hello world\n")
+        (real / "src" / "b.py").write_text("def foo(): pass\n")
+        (tmp_path / "link").symlink_to(real)
+
+        instance = LMStudioAnalysisClient(tmp_path / "link")
+
+        assert instance._tool_read("src/a.py") == "hello world\n"
+        assert sorted(instance._tool_glob("src/*.py").splitlines()) == ["src/a.py", "src/b.py"]
+        assert instance._tool_glob("src/a.py") == "src/a.py"
+        assert instance._scan_files("hello", "src") == (["src/a.py:1:hello world"], False)
+
+    def test_truncates_on_line_boundary_with_resume_offset(self, client, project):
+        line = "x" * 99 + "\n"
+        (project / "big.txt").write_text(line * 1000)  # 100,000 characters
+
+        result = client._tool_read("big.txt")
+
+        body, marker = result.rsplit("... (", 1)
+        assert len(body) <= lm_studio_client._READ_MAX_CHARS
+        assert body.endswith("\n")
+        shown_lines = body.count("\n")
+        assert marker == (
+            f"{100_000 - len(body)} more characters truncated, "
+            f"use offset={shown_lines + 1} to continue)"
+        )
+        # Resuming from the suggested offset continues where the output stopped
+        assert client._tool_read("big.txt", offset=shown_lines + 1, limit=1) == line
+
+    def test_form_feeds_do_not_shift_line_numbers(self, client, project):
+        # str.splitlines would also break on the form feeds
+        lines = [f"{i:04d}" + ("\f" if i % 50 == 0 else "x") + "x" * 94 + "\n" for i in range(1, 1001)]
+        (project / "paged.txt").write_text("".join(lines))
+
+        assert client._tool_read("paged.txt", offset=50, limit=2) == lines[49] + lines[50]
+        assert client._tool_read("paged.txt", offset=1000) == lines[999]
+
+        result = client._tool_read("paged.txt")
+        next_line = int(result.rsplit("offset=", 1)[1].split()[0])
+        assert result.startswith("".join(lines[:next_line - 1]))
+        assert client._tool_read("paged.txt", offset=next_line, limit=1) == lines[next_line - 1]
+
+    def test_truncates_single_overlong_line_without_offset_hint(self, client, project):
+        (project / "minified.js").write_text("y" * 70_000)
+
+        result = client._tool_read("minified.js")
+
+        assert result.endswith(f"\n... ({70_000 - lm_studio_client._READ_MAX_CHARS} more characters truncated)")
+        assert "offset=" not in result
+
+
+# =============================================================================
+# Grep tool
+# =============================================================================
+
+posix_only = pytest.mark.skipif(os.name != "posix", reason="uses shell scripts and signals")
+
+
+@pytest.fixture
+def kill_spy(monkeypatch):
+    """Record the signals _run_grep sends, then deliver them."""
+    sent = []
+    real_kill = os.kill
+
+    def spy(pid, sig):
+        sent.append(sig)
+        real_kill(pid, sig)
+
+    monkeypatch.setattr(lm_studio_client.os, "kill", spy)
+    return sent
+
+
+def write_script(path, body):
+    """Write an executable shell script standing in for a grep binary."""
+    path.write_text("#!/bin/sh\n" + body + "\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+class TestGrepSubprocess:
+    """Tests for Grep through an external grep or rg binary."""
+
+    @pytest.fixture
+    def grep_client(self, client):
+        if shutil.which("grep") is None:
+            pytest.skip("grep not installed")
+        client._grep_bin = shutil.which("grep")
+        client._grep_is_rg = False
+        return client
+
+    @posix_only
+    async def test_caps_output_and_kills_truncated_grep(self, grep_client, project, kill_spy):
+        (project / "src" / "many.txt").write_text("match\n" * 5000)
+
+        result = await grep_client._tool_grep("match", "src")
+
+        lines = result.splitlines()
+        assert lines[-1] == "... (more matches truncated)"
+        assert len(lines) == 101
+        assert kill_spy == [signal.SIGKILL]
+
+    @posix_only
+    async def test_grep_that_runs_to_completion_is_not_killed(self, grep_client, kill_spy):
+        result = await grep_client._tool_grep("hello", "src")
+
+        assert result == "src/a.py:1:hello world"
+        assert kill_spy == []
+
+    async def test_uses_extended_regex(self, grep_client):
+        result = await grep_client._tool_grep("hello|foo", "src")
+
+        assert sorted(result.splitlines()) == ["src/a.py:1:hello world", "src/b.py:1:def foo(): pass"]
+
+    @posix_only
+    async def test_hung_grep_times_out_and_is_killed(self, client, tmp_path, kill_spy):
+        client._grep_bin = write_script(tmp_path / "grep", "exec sleep 30")
+        client._grep_is_rg = False
+        client.GREP_TIMEOUT = 0.2
+
+        assert await client._tool_grep("hello", "src") == "Error: Grep timed out"
+        assert kill_spy == [signal.SIGKILL]
+
+    @posix_only
+    async def test_rg_command_line(self, client, project, tmp_path):
+        # Echo the working directory and arguments instead of searching
+        client._grep_bin = write_script(tmp_path / "rg", 'pwd; printf "%s\\n" "$@"')
+        client._grep_is_rg = True
+
+        result = await client._tool_grep("foo|bar", "src")
+
+        assert result.splitlines() == [
+            str(project.resolve()), "-n", "-uu", "--no-heading", "--with-filename", "foo|bar", "src"
+        ]
+
+
+class TestScanFiles:
+    """Tests for the in-process Grep fallback."""
+
+    @pytest.fixture
+    def scan_client(self, client):
+        client._grep_bin = None
+        client._grep_is_rg = False
+        return client
+
+    async def test_matches_like_grep_and_skips_binary_files(self, scan_client, project):
+        (project / "src" / "blob.bin").write_bytes(b"hello\0world\n")
+
+        result = await scan_client._tool_grep("hello|foo", ".")
+
+        assert result.splitlines() == ["./src/a.py:1:hello world", "./src/b.py:1:def foo(): pass"]
+
+    def test_caps_output_at_100_lines(self, scan_client, project):
+        (project / "src" / "many.txt").write_text("match\n" * 150)
+
+        lines, truncated = scan_client._scan_files("match", "src/many.txt")
+
+        assert truncated
+        assert lines == [f"src/many.txt:{i}:match" for i in range(1, 101)]
+
+    async def test_times_out(self, scan_client):
+        scan_client.GREP_TIMEOUT = -1
+
+        assert await scan_client._tool_grep("hello", ".") == "Error: Grep timed out"
+
+
+# =============================================================================
+# Chat Completions tool loop
+# =============================================================================
+
+class TestChatToolLoop:
+    """Tests for the native tool-calling loop over Chat Completions."""
+
+    @pytest.fixture
+    def tool_runs(self, client, monkeypatch):
+        runs = []
+        run_tool_calls = client._run_tool_calls
+
+        async def spy(calls):
+            runs.append(calls)
+            return await run_tool_calls(calls)
+
+        monkeypatch.setattr(client, "_run_tool_calls", spy)
+        return runs
+
+    async def test_final_turn_does_not_run_tools_or_request_more(self, client, tool_runs):
+        completions = client.client.chat.completions
+        completions.script = [
+            make_chat_response(
+                tool_calls=[make_tool_call(f"call-{i}", "Glob", {"pattern": f"*{i}"})],
+                finish_reason="tool_calls",
+            )
+            for i in range(client.MAX_TURNS)
+        ]
+
+        result = await client.run_analysis_query("analyze")
+
+        assert result == "Analysis terminated: Max turns reached."
+        assert len(completions.calls) == client.MAX_TURNS
+        assert len(tool_runs) == client.MAX_TURNS - 1
+
+    async def test_stops_repeated_identical_calls(self, client, tool_runs):
+        completions = client.client.chat.completions
+        completions.script = [
+            make_chat_response(
+                tool_calls=[make_tool_call(f"call-{i}", "Glob", {"pattern": "*.py"})],
+                finish_reason="tool_calls",
+            )
+            for i in range(client.MAX_TURNS)
+        ]
+
+        result = await client.run_analysis_query("analyze")
+
+        assert result == "Analysis terminated: Repeated tool call loop detected."
+        assert len(completions.calls) == client.MAX_IDENTICAL_TOOL_CALLS + 1
+        assert len(tool_runs) == client.MAX_IDENTICAL_TOOL_CALLS
+
+
+class TestElideToolOutputs:
+    """Tests for eliding large tool outputs from older turns of the chat history."""
+
+    @pytest.fixture
+    def big_files(self, project):
+        for i in range(6):
+            (project / f"c{i}.txt").write_text(str(i) * 3000)
+        return [f"c{i}.txt" for i in range(6)]
+
+    @staticmethod
+    def tool_contents(call):
+        return [m["content"] for m in call["messages"] if isinstance(m, dict) and m.get("role") == "tool"]
+
+    async def test_keeps_every_output_of_a_large_parallel_turn(self, client, big_files):
+        completions = client.client.chat.completions
+        completions.script = [
+            make_chat_response(
+                tool_calls=[
+                    make_tool_call(f"call-{i}", "Read", {"relative_path": path})
+                    for i, path in enumerate(big_files)
+                ],
+                finish_reason="tool_calls",
+            ),
+            make_chat_response('{"score": 90}'),
+        ]
+
+        assert await client.run_analysis_query("analyze") == '{"score": 90}'
+
+        assert self.tool_contents(completions.calls[1]) == [str(i) * 3000 for i in range(6)]
+
+    async def test_elides_outputs_older_than_the_kept_turns(self, client, big_files):
+        keep = client.KEEP_TOOL_TURNS
+        completions = client.client.chat.completions
+        completions.script = [
+            make_chat_response(
+                tool_calls=[make_tool_call(f"call-{turn}", "Read", {"relative_path": big_files[turn]})],
+                finish_reason="tool_calls",
+            )
+            for turn in range(keep + 1)
+        ] + [make_chat_response('{"score": 90}')]
+
+        assert await client.run_analysis_query("analyze") == '{"score": 90}'
+
+        # Turn 0 is still verbatim while it is one of the last KEEP_TOOL_TURNS turns
+        assert self.tool_contents(completions.calls[keep])[0] == "0" * 3000
+        last = self.tool_contents(completions.calls[keep + 1])
+        assert last[0] == "<Read output elided (3000 characters); call Read again if you still need it>"
+        assert last[1:] == [str(turn) * 3000 for turn in range(1, keep + 1)]
+
+
+# =============================================================================
+# Responses API path and fallback
+# =============================================================================
+
+class TestResponsesApi:
+    """Tests for the Responses API loop and its fallback to Chat Completions."""
+
+    async def test_chains_turns_and_sends_only_new_tool_outputs(self, client):
+        responses = FakeEndpoint([
+            make_response("resp-1", [make_function_call("call-1", "Read", {"relative_path": "src/a.py"})]),
+            make_response("resp-2", [SimpleNamespace(type="message")], '{"score": 90}'),
+        ])
+        client.client.responses = responses
+
+        result = await client.run_analysis_query("analyze")
+
+        assert result == '{"score": 90}'
+        first, second = responses.calls
+        assert "previous_response_id" not in first
+        assert first["input"] == [{"role": "user", "content": "analyze"}]
+        assert second["previous_response_id"] == "resp-1"
+        assert second["input"] == [
+            {"type": "function_call_output", "call_id": "call-1", "output": "hello world\n"}
+        ]
+        # Same deterministic decoding as the chat path; no JSON mode on tool turns
+        for call in responses.calls:
+            assert "text" not in call
+            assert call["extra_body"] == {"seed": client.SEED}
+            assert call["temperature"] == 0
+
+    async def test_missing_endpoint_falls_back_to_chat_and_is_remembered(self, client):
+        responses = FakeEndpoint([make_api_error(lm_studio_client.NotFoundError, 404)])
+        client.client.responses = responses
+        client.client.chat.completions.script = [
+            make_chat_response('{"first": 1}'),
+            make_chat_response('{"second": 2}'),
+        ]
+
+        assert await client.run_analysis_query("one") == '{"first": 1}'
+        assert await client.run_analysis_query("two") == '{"second": 2}'
+
+        assert len(responses.calls) == 1
+        assert client.base_url in lm_studio_client._RESPONSES_API_UNSUPPORTED
+
+    async def test_error_payload_with_200_falls_back_to_chat(self, client):
+        client.client.responses = FakeEndpoint([SimpleNamespace(error="Unexpected endpoint or method")])
+        client.client.chat.completions.script = [make_chat_response('{"ok": true}')]
+
+        assert await client.run_analysis_query("analyze") == '{"ok": true}'
+        assert client.base_url in lm_studio_client._RESPONSES_API_UNSUPPORTED
+
+    async def test_bad_request_falls_back_without_disabling_responses_api(self, client):
+        # e.g. a prompt that overflows the context: rejected with and without the seed
+        client.client.responses = FakeEndpoint([
+            make_api_error(lm_studio_client.BadRequestError, 400),
+            make_api_error(lm_studio_client.BadRequestError, 400),
+        ])
+        client.client.chat.completions.script = [make_chat_response('{"ok": true}')]
+
+        assert await client.run_analysis_query("analyze") == '{"ok": true}'
+        assert client.base_url not in lm_studio_client._RESPONSES_API_UNSUPPORTED
+        assert not lm_studio_client._RESPONSES_SEED_UNSUPPORTED
+
+    async def test_rejected_seed_is_dropped_and_remembered(self, client):
+        responses = FakeEndpoint([
+            make_api_error(lm_studio_client.BadRequestError, 400),
+            make_response("resp-1", [], '{"first": 1}'),
+            make_response("resp-2", [], '{"second": 2}'),
+        ])
+        client.client.responses = responses
+
+        assert await client.run_analysis_query("one") == '{"first": 1}'
+        assert await client.run_analysis_query("two") == '{"second": 2}'
+
+        assert ["extra_body" in call for call in responses.calls] == [True, False, False]
+        assert (client.base_url, client.model) in lm_studio_client._RESPONSES_SEED_UNSUPPORTED
+
+
+# =============================================================================
+# Chat Completions JSON mode
+# =============================================================================
+
+class TestChatJsonMode:
+    """Tests for when _create_completion requests JSON mode, and its retry."""
+
+    async def test_tool_turns_do_not_request_json_mode(self, client):
+        completions = client.client.chat.completions
+        completions.script = [
+            make_chat_response(
+                tool_calls=[make_tool_call("call-1", "Read", {"relative_path": "src/a.py"})],
+                finish_reason="tool_calls",
+            ),
+            make_chat_response('{"score": 90}'),
+        ]
+
+        assert await client.run_analysis_query("analyze") == '{"score": 90}'
+
+        for call in completions.calls:
+            assert call["tools"] == lm_studio_client._TOOL_DEFS
+            assert "response_format" not in call
+            assert call["seed"] == client.SEED
+
+    async def test_requests_without_tools_use_json_mode(self, text_client):
+        completions = text_client.client.chat.completions
+        completions.script = [make_chat_response('{"score": 90}')]
+
+        assert await text_client.run_analysis_query("analyze") == '{"score": 90}'
+
+        (call,) = completions.calls
+        assert "tools" not in call
+        assert call["response_format"] == {"type": "json_object"}
+
+    async def test_rejected_json_mode_is_dropped_and_remembered(self, text_client):
+        completions = text_client.client.chat.completions
+        completions.script = [
+            make_api_error(lm_studio_client.BadRequestError, 400),
+            make_chat_response('{"first": 1}'),
+            make_chat_response('{"second": 2}'),
+        ]
+
+        assert await text_client.run_analysis_query("one") == '{"first": 1}'
+        assert await text_client.run_analysis_query("two") == '{"second": 2}'
+
+        assert ["response_format" in call for call in completions.calls] == [True, False, False]
+        assert all(call["seed"] == text_client.SEED for call in completions.calls)
+        assert (text_client.base_url, text_client.model) in lm_studio_client._JSON_MODE_UNSUPPORTED
+
+    async def test_request_rejected_either_way_does_not_disable_json_mode(self, text_client):
+        text_client.client.chat.completions.script = [
+            make_api_error(lm_studio_client.BadRequestError, 400),
+            make_api_error(lm_studio_client.BadRequestError, 400),
+        ]
+
+        result = await text_client.run_analysis_query("analyze")
+
+        assert result.startswith("Error communicating with LM Studio")
+        assert not lm_studio_client._JSON_MODE_UNSUPPORTED
+
+
+# =============================================================================
+# Tool support probe
+# =============================================================================
+
+class TestToolSupportProbe:
+    """Tests for the native tool-calling capability probe."""
+
+    @pytest.fixture
+    def unprobed(self, client):
+        lm_studio_client._TOOL_SUPPORT.clear()
+        return client
+
+    async def test_tool_call_means_supported(self, unprobed):
+        unprobed.client.chat.completions.script = [
+            make_chat_response(tool_calls=[make_tool_call("call-1", "Glob", {"pattern": "*"})])
+        ]
+
+        assert await unprobed._supports_tools() is True
+        assert lm_studio_client._TOOL_SUPPORT[(unprobed.base_url, unprobed.model)] is True
+
+    async def test_plain_stop_means_unsupported_and_is_logged(self, unprobed, caplog):
+        unprobed.client.chat.completions.script = [make_chat_response("I cannot call tools.")]
+
+        with caplog.at_level("INFO", logger=lm_studio_client.__name__):
+            assert await unprobed._supports_tools() is False
+
+        assert "does not support tool calling" in caplog.text
+        assert await unprobed._supports_tools() is False
+        assert len(unprobed.client.chat.completions.calls) == 1
+
+    @pytest.mark.parametrize(
+        "outcome",
+        [
+            make_chat_response("Let me think", finish_reason="length"),
+            make_api_error(lm_studio_client.BadRequestError, 400),
+            TimeoutError(),
+        ],
+    )
+    async def test_inconclusive_probe_is_not_repeated_until_retry_time(self, unprobed, outcome):
+        completions = unprobed.client.chat.completions
+        completions.script = [outcome, make_chat_response("No tools here.")]
+        key = (unprobed.base_url, unprobed.model)
+
+        assert await unprobed._supports_tools() is True
+        assert await unprobed._supports_tools() is True
+        assert len(completions.calls) == 1
+        assert key not in lm_studio_client._TOOL_SUPPORT
+
+        # Once the retry time has passed, the next query probes again
+        lm_studio_client._TOOL_PROBE_RETRY_AT[key] = 0.0
+        assert await unprobed._supports_tools() is False
+        assert len(completions.calls) == 2
+        assert key not in lm_studio_client._TOOL_PROBE_RETRY_AT
+
+    async def test_concurrent_queries_share_one_probe(self, unprobed):
+        unprobed.client.chat.completions = FakeEndpoint([make_chat_response("No tools here.")], delay=0.01)
+
+        results = await asyncio.gather(*(unprobed._supports_tools() for _ in range(5)))
+
+        assert results == [False] * 5
+        assert len(unprobed.client.chat.completions.calls) == 1
+
+
+# =============================================================================
+# Text tool protocol
+# =============================================================================
+
+class TestParseTextToolCall:
+    """Tests for recognizing text-protocol tool calls."""
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            '{"tool": "Read", "arguments": {"relative_path": "src/a.py"}}',
+            '  {"tool": "Read", "arguments": {"relative_path": "src/a.py"}}\n',
+            '```json\n{"tool": "Read", "arguments": {"relative_path": "src/a.py"}}\n```',
+            '```\n{"tool": "Read", "arguments": {"relative_path": "src/a.py"}}\n```',
+        ],
+    )
+    def test_parses_fenced_and_unfenced_calls(self, content):
+        name, arguments = lm_studio_client._parse_text_tool_call(content)
+
+        assert name == "Read"
+        assert json.loads(arguments) == {"relative_path": "src/a.py"}
+
+    def test_missing_arguments_default_to_empty_object(self):
+        assert lm_studio_client._parse_text_tool_call('{"tool": "Glob"}') == ("Glob", "{}")
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            '{"score": 90, "findings": []}',
+            '{"tool": "Delete", "arguments": {"path": "/"}}',
+            '["Read"]',
+            "The answer is 42.",
+            "",
+        ],
+    )
+    def test_rejects_non_tool_replies(self, content):
+        assert lm_studio_client._parse_text_tool_call(content) is None
+
+
+class TestTextToolProtocol:
+    """Tests for the tool loop used by models without native function calling."""
+
+    async def test_runs_tool_and_returns_final_answer(self, text_client):
+        completions = text_client.client.chat.completions
+        call = '```json\n{"tool": "Read", "arguments": {"relative_path": "src/a.py"}}\n```'
+        completions.script = [make_chat_response(call), make_chat_response('{"score": 90}')]
+
+        assert await text_client.run_analysis_query("analyze") == '{"score": 90}'
+
+        first, second = completions.calls
+        assert "tools" not in first
+        assert lm_studio_client._TEXT_TOOL_PROTOCOL in first["messages"][0]["content"]
+        assert second["messages"][-2:] == [
+            {"role": "assistant", "content": call},
+            {"role": "user", "content": "Result of Read:\nhello world\n"},
+        ]
+
+    async def test_stops_repeated_identical_calls(self, text_client):
+        call = '{"tool": "Glob", "arguments": {"pattern": "*.py"}}'
+        text_client.client.chat.completions.script = [make_chat_response(call)] * 10
+
+        result = await text_client.run_analysis_query("analyze")
+
+        assert result == "Analysis terminated: Repeated tool call loop detected."
+        assert len(text_client.client.chat.completions.calls) == text_client.MAX_IDENTICAL_TOOL_CALLS + 1